@@ -74,7 +74,7 @@ class MultiScaleDiceLoss(nn.Module):
         pix_w   = loss_input_dict['pixel_weight']
         cls_w   = loss_input_dict['class_weight']
         softmax = loss_input_dict['softmax']
-        if(isinstance(predict, tuple) or isinstance(predict, list)):
+        if(isinstance(predict, (list, tuple))):
             predict_num = len(predict)
             assert(predict_num == len(self.multi_scale_weight))
             loss   = 0.0
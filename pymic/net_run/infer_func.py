@@ -19,7 +19,7 @@ def volume_infer(image, net, device, class_num,
     image = image.to(device)
     if(mini_patch_inshape is None):
         outputs = net(image)
-        if(isinstance(outputs, tuple) or isinstance(outputs, list)):
+        if(isinstance(outputs, (list, tuple))):
             outputs = [item.cpu().numpy() for item in outputs]
             outputs = outputs[:output_num]
         else:
@@ -99,7 +99,7 @@ def volume_infer_by_patch(image, net, device, class_num,
         data_mini_batch = data_mini_batch.to(device)
 
         out_mini_batch  = net(data_mini_batch) # the network may give multiple predictions
-        if(not(isinstance(out_mini_batch, tuple) or isinstance(out_mini_batch, list))):
+        if(not(isinstance(out_mini_batch, (list, tuple)))):
             out_mini_batch = [out_mini_batch]
         out_mini_batch  = [item.cpu().numpy() for item in out_mini_batch]
 
@@ -186,11 +186,12 @@ class NetRunAgent(object):
                 trainIter = iter(self.train_loader)
                 data = next(trainIter)
 
-            # get the inputs
-            inputs      = self.convert_tensor_type(data['image'])
+            # get the inputs. image and weight are sent to the device before 
+            # type conversion, so that half precision inputs are transferred as is
+            inputs      = self.convert_tensor_type(data['image'].to(device))
             labels_prob = self.convert_tensor_type(data['label_prob'])
             if(pixelweight_enabled):
-                pix_w = self.convert_tensor_type(data['weight'])
+                pix_w = self.convert_tensor_type(data['weight'].to(device))
             else:
                 pix_w = None  
             
@@ -225,7 +226,7 @@ class NetRunAgent(object):
             self.schedule.step()
 
             # get dice evaluation for each class
-            if(isinstance(outputs, tuple) or isinstance(outputs, list)):
+            if(isinstance(outputs, (list, tuple))):
                 outputs = outputs[0] 
             outputs_argmax = torch.argmax(outputs, dim = 1, keepdim = True)
             soft_out       = get_soft_label(outputs_argmax, class_num, self.tensor_type)
@@ -246,12 +247,11 @@ class NetRunAgent(object):
                 valid_dice_list = []
                 with torch.no_grad():
                     for data in self.valid_loader:
-                        inputs      = self.convert_tensor_type(data['image'])
+                        inputs      = self.convert_tensor_type(data['image'].to(device))
                         labels_prob = self.convert_tensor_type(data['label_prob'])
-                        inputs, labels_prob = inputs.to(device), labels_prob.to(device)
+                        labels_prob = labels_prob.to(device)
                         if(pixelweight_enabled):
-                            pix_w = self.convert_tensor_type(data['weight'])
-                            pix_w = pix_w.to(device)
+                            pix_w = self.convert_tensor_type(data['weight'].to(device))
                         else:
                             pix_w = None
                     
@@ -261,7 +261,7 @@ class NetRunAgent(object):
                         loss   = self.loss_calculater(loss_input_dict)
                         valid_loss = valid_loss + loss.item()
 
-                        if(isinstance(outputs, tuple) or isinstance(outputs, list)):
+                        if(isinstance(outputs, (list, tuple))):
                             outputs = outputs[0] 
                         outputs_argmax = torch.argmax(outputs, dim = 1, keepdim = True)
                         soft_out  = get_soft_label(outputs_argmax, class_num, self.tensor_type)
@@ -331,7 +331,7 @@ class NetRunAgent(object):
         #     testx = self.convert_tensor_type(testx)
         #     testx = testx.to(device)
         #     testy = self.net(testx)
-        #     if(isinstance(testy, tuple) or isinstance(testy, list)):
+        #     if(isinstance(testy, (list, tuple))):
         #         testy = testy[0] 
         #     testy = testy.detach().cpu().numpy()
         #     mini_patch_outshape = testy.shape[2:]
@@ -362,7 +362,7 @@ class NetRunAgent(object):
                     if (self.transform_list[i].inverse):
                         data = self.transform_list[i].inverse_transform_for_prediction(data) 
                 predict_list = [data['predict']]
-                if(isinstance(data['predict'], tuple) or isinstance(data['predict'], list)):
+                if(isinstance(data['predict'], (list, tuple))):
                     predict_list = data['predict']
 
                 # for item in predict_list:
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+import numpy as np
+from numba import njit
+from pymic.util.bbox_numba import bbox_from_row_range
+
+@njit(cache = True)
+def _row_foreground_range(rows, mask_labels):
+    """
+    for each row of a 2D label array, get the first and last index of 
+    elements that are one of mask_labels (row length and -1 if there is 
+    none), and count these elements over the whole array.
+    """
+    row_num, row_len = rows.shape
+    row_min = np.full(row_num, row_len, np.int64)
+    row_max = np.full(row_num, -1, np.int64)
+    nnz = 0
+    for r in range(row_num):
+        first = row_len
+        last  = -1
+        count = 0
+        for j in range(row_len):
+            value = rows[r, j]
+            for k in range(mask_labels.size):
+                if(value == mask_labels[k]):
+                    if(first == row_len):
+                        first = j
+                    last  = j
+                    count += 1
+                    break
+        row_min[r] = first
+        row_max[r] = last
+        nnz += count
+    return nnz, row_min, row_max
+
+def build_fg_mask_bbox(label, mask_labels):
+    """
+    get the number of foreground elements (i.e., with one of mask_labels) in 
+    a label array and their bounding box, with a single pass over the label
+    and without allocating the foreground mask.
+    return (nnz, bb_min, bb_max), where bb_min and bb_max are None if nnz is 0.
+    """
+    input_shape = label.shape
+    rows = label.reshape(-1, input_shape[-1])
+    nnz, row_min, row_max = _row_foreground_range(rows, mask_labels)
+    if(nnz == 0):
+        return 0, None, None
+    bb_min, bb_max = bbox_from_row_range(input_shape, row_min, row_max)
+    return nnz, bb_min, bb_max
@@ -2,6 +2,9 @@
 from __future__ import print_function, division
 
 class AbstractTransform(object):
+    # no instance dict is required here, so that subclasses can use __slots__
+    __slots__ = ()
+
     def __init__(self, params):
         pass
 
@@ -2,18 +2,94 @@
 from __future__ import print_function, division
 
 import torch
-import json
 import math
-import random
 import numpy as np
 from scipy import ndimage
 from pymic.transform.abstract_transform import AbstractTransform
 from pymic.util.image_process import *
+try:
+    from pymic.transform._crop_kernels import build_fg_mask_bbox
+    from pymic.util.bbox_numba import is_kernel_supported
+except ImportError:
+    build_fg_mask_bbox = None
+
+def _get_crop_slice(crop_min, crop_max):
+    """
+    get the slice tuple to crop a volume with shape [C, D, H, W] or [C, H, W]
+    along the spatial axes. all the channels are kept.
+    """
+    if(len(crop_min) == 4):
+        return (slice(None), slice(crop_min[1], crop_max[1]),
+                slice(crop_min[2], crop_max[2]), slice(crop_min[3], crop_max[3]))
+    elif(len(crop_min) == 3):
+        return (slice(None), slice(crop_min[1], crop_max[1]),
+                slice(crop_min[2], crop_max[2]))
+    return (slice(None),) + tuple(slice(crop_min[i], crop_max[i]) \
+        for i in range(1, len(crop_min)))
+
+def _get_crop_param(input_shape, crop_min, crop_max):
+    """
+    pack the input shape and the crop range into an int32 array with shape
+    [3, N], which is cheap to pickle and collate in a DataLoader.
+    """
+    return np.asarray([input_shape, crop_min, crop_max], dtype = np.int32)
+
+def _parse_crop_param(params):
+    """
+    get the spatial input shape and the spatial crop range as tuples from 
+    the array given by _get_crop_param. after collation by a DataLoader,
+    the array becomes a tensor with shape [1, 3, N] (batch size is 1).
+    """
+    params = np.asarray(params)
+    if(params.ndim == 3):
+        params = params[0]
+    spatial_params = params[:, 1:].tolist()
+    return tuple(spatial_params[0]), tuple(spatial_params[1]), tuple(spatial_params[2])
+
+def _crop_sample(sample, crop_slice):
+    """
+    crop sample['image'], and sample['label'] and sample['weight'] if they
+    have the same spatial shape as the image, with one shared slice tuple.
+    slicing returns views, so that no data is copied.
+    """
+    image = sample['image']
+    for key in ['image', 'label', 'weight']:
+        if(key in sample and sample[key].shape[1:] == image.shape[1:]):
+            sample[key] = sample[key][crop_slice]
+
+def _paste_to_zero_volume(sub_volume, volume_shape, crop_min, crop_max):
+    """
+    get a volume with shape volume_shape, where the region [crop_min, crop_max)
+    is set to sub_volume and the remaining part is zero. only the border 
+    around that region is filled with zeros, instead of the whole volume.
+    """
+    volume = np.empty(volume_shape, sub_volume.dtype)
+    roi = tuple(slice(crop_min[i], crop_max[i]) for i in range(len(volume_shape)))
+    volume[roi] = sub_volume
+    # the border slabs along axis i are restricted to the roi along the
+    # previous axes, so that each element is written only once
+    for i in range(len(volume_shape)):
+        if(crop_min[i] > 0):
+            volume[roi[:i] + (slice(0, crop_min[i]),)] = 0
+        if(crop_max[i] < volume_shape[i]):
+            volume[roi[:i] + (slice(crop_max[i], None),)] = 0
+    return volume
+
+def _uncrop_prediction(predict, spatial_shape, spatial_min, spatial_max):
+    """
+    put a prediction with shape [N, C, D, H, W] or [N, C, H, W] back to the 
+    region [spatial_min, spatial_max) of the original spatial_shape.
+    """
+    prefix_shape = tuple(predict.shape[:2])
+    return _paste_to_zero_volume(predict, prefix_shape + spatial_shape,
+        (0, 0) + spatial_min, prefix_shape + spatial_max)
 
 
 class CropWithBoundingBox(AbstractTransform):
     """Crop the image (shape [C, D, H, W] or [C, H, W]) based on bounding box
     """
+    __slots__ = ('start', 'output_size', 'inverse', '_output_size_arr', '_half_out')
+
     def __init__(self, params):
         """
         start (None or tuple/list): The start index along each spatial axis.
@@ -25,48 +101,49 @@ class CropWithBoundingBox(AbstractTransform):
         self.start       = params['CropWithBoundingBox_start'.lower()]
         self.output_size = params['CropWithBoundingBox_output_size'.lower()]
         self.inverse = params['CropWithBoundingBox_inverse'.lower()]
+        if(self.output_size is not None):
+            self._output_size_arr = np.asarray(self.output_size, dtype = np.int64)
+            self._half_out = self._output_size_arr // 2
+        else:
+            self._output_size_arr = None
+            self._half_out = None
         
     def __call__(self, sample):
         image = sample['image']
         input_shape = image.shape
         input_dim   = len(input_shape) - 1
         bb_min, bb_max = get_ND_bounding_box(image)
-        bb_min, bb_max = bb_min[1:], bb_max[1:]
+        bb_min = np.asarray(bb_min[1:], dtype = np.int64)
+        bb_max = np.asarray(bb_max[1:], dtype = np.int64)
         if(self.start is None):
             if(self.output_size is None):
                 crop_min, crop_max = bb_min, bb_max
             else:
                 assert(len(self.output_size) == input_dim)
-                crop_min = [int((bb_min[i] + bb_max[i] + 1)/2) - int(self.output_size[i]/2) \
-                    for i in range(input_dim)]
-                crop_min = [max(0, crop_min[i]) for i in range(input_dim)]
-                crop_max = [crop_min[i] + self.output_size[i] for i in range(input_dim)]
+                # shift the window so that it fits inside the image
+                crop_margin = np.asarray(input_shape[1:], dtype = np.int64) - self._output_size_arr
+                crop_min = (bb_min + bb_max + 1) // 2 - self._half_out
+                crop_min = np.maximum(np.minimum(crop_min, crop_margin), 0)
+                crop_max = crop_min + self._output_size_arr
         else:
             assert(len(self.start) == input_dim)
-            crop_min = self.start
+            crop_min = np.asarray(self.start, dtype = np.int64)
             if(self.output_size is None):
-                assert(len(self.output_size) == input_dim)
-                crop_max = [crop_min[i] + bb_max[i] - bb_min[i] \
-                    for i in range(input_dim)]
+                crop_max = crop_min + bb_max - bb_min
             else:
-                crop_max =  [crop_min[i] + self.output_size[i] for i in range(input_dim)]
-        crop_min = [0] + crop_min
-        crop_max = list(input_shape[0:1]) + crop_max
-        sample['CropWithBoundingBox_Param'] = json.dumps((input_shape, crop_min, crop_max))
+                crop_max = crop_min + self._output_size_arr
+        # slicing does not check the bounds, so check them explicitly
+        assert((crop_min >= 0).all() and (crop_max <= input_shape[1:]).all()), \
+            "crop region {0:}-{1:} is out of the image shape {2:}".format(
+            crop_min.tolist(), crop_max.tolist(), input_shape)
+        crop_min = [0] + crop_min.tolist()
+        crop_max = list(input_shape[0:1]) + crop_max.tolist()
+        sample['CropWithBoundingBox_Param'] = _get_crop_param(input_shape, crop_min, crop_max)
 
-        image_t = crop_ND_volume_with_bounding_box(image, crop_min, crop_max)
-        sample['image'] = image_t
-        
-        if('label' in sample and sample['label'].shape[1:] == image.shape[1:]):
-            label = sample['label']
-            crop_max[0] = label.shape[0]
-            label = crop_ND_volume_with_bounding_box(label, crop_min, crop_max)
-            sample['label'] = label
-        if('weight' in sample and sample['weight'].shape[1:] == image.shape[1:]):
-            weight = sample['weight']
-            crop_max[0] = weight.shape[0]
-            weight = crop_ND_volume_with_bounding_box(weight, crop_min, crop_max)
-            sample['weight'] = weight
+        # skip the crop if the region covers the whole volume
+        if(not any(crop_min) and crop_max == list(input_shape)):
+            return sample
+        _crop_sample(sample, _get_crop_slice(crop_min, crop_max))
         return sample
 
     def inverse_transform_for_prediction(self, sample):
@@ -75,32 +152,15 @@ class CropWithBoundingBox(AbstractTransform):
          different elemenets in the batch.
 
         origin_shape is a 4D or 3D vector as saved in __call__().'''
-        if(isinstance(sample['CropWithBoundingBox_Param'], list) or \
-            isinstance(sample['CropWithBoundingBox_Param'], tuple)):
-            params = json.loads(sample['CropWithBoundingBox_Param'][0]) 
-        else:
-            params = json.loads(sample['CropWithBoundingBox_Param']) 
-        origin_shape = params[0]
-        crop_min     = params[1]
-        crop_max     = params[2]
+        spatial_shape, spatial_min, spatial_max = _parse_crop_param(
+            sample['CropWithBoundingBox_Param'])
         predict = sample['predict']
-        if(isinstance(predict, tuple) or isinstance(predict, list)):
-            output_predict = []
-            for predict_i in predict:
-                origin_shape     = list(predict_i.shape[:2]) + origin_shape[1:]
-                output_predict_i = np.zeros(origin_shape, predict_i.dtype)
-                crop_min = [0, 0] + crop_min[1:]
-                crop_max = list(predict_i.shape[:2]) + crop_max[1:]
-                output_predict_i = set_ND_volume_roi_with_bounding_box_range(output_predict_i,
-                    crop_min, crop_max, predict_i)
-                output_predict.append(output_predict_i)
+        if(isinstance(predict, (list, tuple))):
+            output_predict = [_uncrop_prediction(predict_i, spatial_shape, 
+                spatial_min, spatial_max) for predict_i in predict]
         else:
-            origin_shape   = list(predict.shape[:2]) + origin_shape[1:]
-            output_predict = np.zeros(origin_shape, predict.dtype)
-            crop_min = [0, 0] + crop_min[1:]
-            crop_max = list(predict.shape[:2]) + crop_max[1:]
-            output_predict = set_ND_volume_roi_with_bounding_box_range(output_predict,
-                crop_min, crop_max, predict)
+            output_predict = _uncrop_prediction(predict, spatial_shape, 
+                spatial_min, spatial_max)
 
         sample['predict'] = output_predict
         return sample
@@ -108,6 +168,10 @@ class CropWithBoundingBox(AbstractTransform):
 class RandomCrop(object):
     """Randomly crop the input image (shape [C, D, H, W] or [C, H, W]) 
     """
+    __slots__ = ('output_size', 'fg_focus', 'fg_ratio', 'mask_label', 'inverse', 'output_dtype',
+        '_output_size_arr', '_half_out', '_mask_label_arr', '_label_lut',
+        '_rng', '_rng_seed')
+
     def __init__(self, params):
         """
         output_size (tuple or list): Desired output size [D, H, W] or [H, W].
@@ -117,61 +181,149 @@ class RandomCrop(object):
             focus cropping when foreground_focus is true.
         mask_label (None, or tuple / list): Specifying the foreground labels for foreground 
             focus cropping
+        output_dtype (None or str, optional): If 'float16', 'bfloat16' or 'float32', 
+            convert the cropped image and weight to that type (the label is kept
+            unchanged). Half precision reduces the data transferred to the GPU.
+            bfloat16 arrays are stored as torch tensors as numpy has no such type.
         """
         self.output_size = params['RandomCrop_output_size'.lower()]
         self.fg_focus    = params['RandomCrop_foreground_focus'.lower()]
         self.fg_ratio    = params['RandomCrop_foreground_ratio'.lower()]
         self.mask_label  = params['RandomCrop_mask_label'.lower()]
         self.inverse     = params['RandomCrop_inverse'.lower()]
+        self.output_dtype = params.get('RandomCrop_output_dtype'.lower(), None)
         assert isinstance(self.output_size, (list, tuple))
+        assert self.output_dtype in (None, 'float16', 'bfloat16', 'float32')
         if(self.mask_label is not None):
             assert isinstance(self.mask_label, (list, tuple))
+        self._output_size_arr = np.asarray(self.output_size, dtype = np.int64)
+        self._half_out = self._output_size_arr // 2
+        if(self.mask_label):
+            self._mask_label_arr = np.asarray(self.mask_label, dtype = np.int64)
+        else:
+            self._mask_label_arr = None
+        # lookup table to get the foreground mask of uint8 label maps when
+        # numba is not available
+        self._label_lut = None
+        if(self.mask_label and min(self.mask_label) >= 0 and max(self.mask_label) < 256):
+            self._label_lut = np.zeros(256, dtype = np.uint8)
+            self._label_lut[list(self.mask_label)] = 1
+        self._rng = None
+        self._rng_seed = None
+
+    def _get_rng(self):
+        """
+        get the random generator for the current process. in a DataLoader 
+        worker, the generator is created from the seed that torch assigns to 
+        the worker, so that different workers and epochs do not replay the 
+        same random stream copied from the main process.
+        """
+        worker_info = torch.utils.data.get_worker_info()
+        seed = None if worker_info is None else worker_info.seed
+        if(self._rng is None or self._rng_seed != seed):
+            self._rng = np.random.default_rng(seed)
+            self._rng_seed = seed
+        return self._rng
+
+    def _get_foreground_bounding_box(self, label):
+        """
+        get the bounding box of the region with mask_label in a label array.
+        the whole volume is used if none of mask_label is present.
+        """
+        if(build_fg_mask_bbox is not None and is_kernel_supported(label)):
+            # count the foreground and get its bounding box in a single pass
+            nnz, bb_min, bb_max = build_fg_mask_bbox(label, self._mask_label_arr)
+            if(nnz == 0):
+                return [0] * len(label.shape), label.shape
+            return bb_min, bb_max
+        elif(self._label_lut is not None and label.dtype == np.uint8):
+            mask = self._label_lut[label]
+        else:
+            mask  = np.zeros_like(label)
+            for temp_lab in self._mask_label_arr:
+                mask = np.maximum(mask, label == temp_lab)
+        if(not mask.any()):
+            return [0] * len(label.shape), label.shape
+        return get_ND_bounding_box(mask)
+
+    def _get_foreground_bounding_box_torch(self, label):
+        """
+        the same as _get_foreground_bounding_box, but for a torch tensor. the
+        mask is computed on the device of the label (e.g., GPU), and only 
+        the bounding box is transferred back.
+        """
+        mask = torch.zeros_like(label, dtype = torch.bool)
+        for temp_lab in self.mask_label:
+            mask = mask | (label == temp_lab)
+        dim = mask.dim()
+        if(not mask.any()):
+            return [0] * dim, list(mask.shape)
+        bb_min, bb_max = [], []
+        for i in range(dim):
+            other_axes = [j for j in range(dim) if j != i]
+            axis_nonzero = torch.nonzero(mask.sum(dim = other_axes) > 0)
+            bb_min.append(int(axis_nonzero.min()))
+            bb_max.append(int(axis_nonzero.max()) + 1)
+        return bb_min, bb_max
+
+    def _convert_output_type(self, sample):
+        """
+        convert sample['image'] and sample['weight'] to self.output_dtype.
+        """
+        if(self.output_dtype is None):
+            return
+        for key in ['image', 'weight']:
+            if(key not in sample):
+                continue
+            value = sample[key]
+            if(self.output_dtype == 'bfloat16' and not torch.is_tensor(value)):
+                value = torch.from_numpy(value)
+            if(torch.is_tensor(value)):
+                sample[key] = value.to(getattr(torch, self.output_dtype))
+            else:
+                sample[key] = value.astype(self.output_dtype, copy = False)
 
     def __call__(self, sample):
+        """
+        sample['image'] (and sample['label'], sample['weight']) can be either
+        numpy arrays or torch tensors. for tensors, the crop is a view on the
+        same device, so that GPU data is not copied back to the host.
+        """
         image = sample['image']
-        input_shape = image.shape
+        input_shape = tuple(image.shape)
         input_dim   = len(input_shape) - 1
 
-        assert(input_dim == len(self.output_size))
-        crop_margin = [input_shape[i + 1] - self.output_size[i]\
-            for i in range(input_dim)]
-        crop_min = [random.randint(0, item) for item in crop_margin]
-        if(self.fg_focus and random.random() < self.fg_ratio):
+        assert(input_dim == len(self._output_size_arr))
+        # the output size is the same as the input size, keep the sample
+        # unchanged and record an identity crop for the inverse transform
+        if(tuple(self.output_size) == input_shape[1:]):
+            sample['RandomCrop_Param'] = _get_crop_param(input_shape, 
+                [0] * len(input_shape), input_shape)
+            self._convert_output_type(sample)
+            return sample
+        crop_margin = np.asarray(input_shape[1:], dtype = np.int64) - self._output_size_arr
+        rng = self._get_rng()
+        crop_min = rng.integers(0, crop_margin + 1)
+        if(self.fg_focus and rng.random() < self.fg_ratio):
             label = sample['label']
-            mask  = np.zeros_like(label)
-            for temp_lab in self.mask_label:
-                mask = np.maximum(mask, label == temp_lab)
-            if(mask.sum() == 0):
-                bb_min = [0] * (input_dim + 1)
-                bb_max = mask.shape
+            if(torch.is_tensor(label)):
+                bb_min, bb_max = self._get_foreground_bounding_box_torch(label)
             else:
-                bb_min, bb_max = get_ND_bounding_box(mask)
-            bb_min, bb_max = bb_min[1:], bb_max[1:]
-            crop_min = [random.randint(bb_min[i], bb_max[i]) - int(self.output_size[i]/2) \
-                for i in range(input_dim)]
-            crop_min = [max(0, item) for item in crop_min]
-            crop_min = [min(crop_min[i], input_shape[i+1] - self.output_size[i]) \
-                for i in range(input_dim)]
-
-        crop_max = [crop_min[i] + self.output_size[i] \
-            for i in range(input_dim)]
-        crop_min = [0] + crop_min
-        crop_max = list(input_shape[0:1]) + crop_max
-        sample['RandomCrop_Param'] = json.dumps((input_shape, crop_min, crop_max))
-
-        image_t = crop_ND_volume_with_bounding_box(image, crop_min, crop_max)
-        sample['image'] = image_t
-        
-        if('label' in sample and sample['label'].shape[1:] == image.shape[1:]):
-            label = sample['label']
-            crop_max[0] = label.shape[0]
-            label = crop_ND_volume_with_bounding_box(label, crop_min, crop_max)
-            sample['label'] = label
-        if('weight' in sample and sample['weight'].shape[1:] == image.shape[1:]):
-            weight = sample['weight']
-            crop_max[0] = weight.shape[0]
-            weight = crop_ND_volume_with_bounding_box(weight, crop_min, crop_max)
-            sample['weight'] = weight
+                bb_min, bb_max = self._get_foreground_bounding_box(label)
+            bb_min = np.asarray(bb_min[1:], dtype = np.int64)
+            bb_max = np.asarray(bb_max[1:], dtype = np.int64)
+            # np.minimum(np.maximum()) has less overhead than np.clip on such
+            # short arrays
+            crop_center = rng.integers(bb_min, bb_max + 1)
+            crop_min = np.minimum(np.maximum(crop_center - self._half_out, 0), crop_margin)
+
+        crop_max = crop_min + self._output_size_arr
+        crop_min = [0] + crop_min.tolist()
+        crop_max = list(input_shape[0:1]) + crop_max.tolist()
+        sample['RandomCrop_Param'] = _get_crop_param(input_shape, crop_min, crop_max)
+
+        _crop_sample(sample, _get_crop_slice(crop_min, crop_max))
+        self._convert_output_type(sample)
         return sample
 
     def inverse_transform_for_prediction(self, sample):
@@ -180,21 +332,10 @@ class RandomCrop(object):
          different elemenets in the batch.
 
         origin_shape is a 4D or 3D vector as saved in __call__().'''
-        if(isinstance(sample['RandomCrop_Param'], list) or \
-            isinstance(sample['RandomCrop_Param'], tuple)):
-            params = json.loads(sample['RandomCrop_Param'][0]) 
-        else:
-            params = json.loads(sample['RandomCrop_Param']) 
-        origin_shape = params[0]
-        crop_min     = params[1]
-        crop_max     = params[2]
-        predict = sample['predict']
-        origin_shape   = list(predict.shape[:2]) + origin_shape[1:]
-        output_predict = np.zeros(origin_shape, predict.dtype)
-        crop_min = [0, 0] + crop_min[1:]
-        crop_max = list(predict.shape[:2]) + crop_max[1:]
-        output_predict = set_ND_volume_roi_with_bounding_box_range(output_predict,
-            crop_min, crop_max, predict)
+        spatial_shape, spatial_min, spatial_max = _parse_crop_param(
+            sample['RandomCrop_Param'])
+        output_predict = _uncrop_prediction(sample['predict'], spatial_shape, 
+            spatial_min, spatial_max)
 
         sample['predict'] = output_predict
         return sample
\ No newline at end of file
@@ -58,8 +58,7 @@ class RandomFlip(AbstractTransform):
          different elemenets in the batch.
 
         flip_axis is a list as saved in __call__().'''
-        if(isinstance(sample['RandomFlip_Param'], list) or \
-            isinstance(sample['RandomFlip_Param'], tuple)):
+        if(isinstance(sample['RandomFlip_Param'], (list, tuple))):
             flip_axis = json.loads(sample['RandomFlip_Param'][0]) 
         else:
             flip_axis = json.loads(sample['RandomFlip_Param']) 
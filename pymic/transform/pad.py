@@ -67,18 +67,18 @@ class Pad(AbstractTransform):
 
         origin_shape is a 4D or 3D vector as saved in __call__().'''
         # raise ValueError("not implemented")
-        if(isinstance(sample['Pad_Param'], list) or isinstance(sample['Pad_Param'], tuple)):
+        if(isinstance(sample['Pad_Param'], (list, tuple))):
             params = json.loads(sample['Pad_Param'][0]) 
         else:
             params = json.loads(sample['Pad_Param']) 
         margin_lower = params[0]
         margin_upper = params[1]
         predict = sample['predict']
-        if(isinstance(predict, tuple) or isinstance(predict, list)):
+        if(isinstance(predict, (list, tuple))):
             output_predict = []
+            crop_min = [0, 0] + margin_lower
             for predict_i in predict:
                 predict_shape = predict_i.shape
-                crop_min = [0, 0] + margin_lower
                 crop_max = [predict_shape[2:][i] - margin_upper[i] \
                     for i in range(len(margin_lower))]
                 crop_max = list(predict_shape[:2]) + crop_max
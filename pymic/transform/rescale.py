@@ -63,8 +63,7 @@ class Rescale(AbstractTransform):
          different elemenets in the batch.
 
         origin_shape is a 4D or 3D vector as saved in __call__().'''
-        if(isinstance(sample['Rescale_origin_shape'], list) or \
-            isinstance(sample['Rescale_origin_shape'], tuple)):
+        if(isinstance(sample['Rescale_origin_shape'], (list, tuple))):
             origin_shape = json.loads(sample['Rescale_origin_shape'][0])
         else:
             origin_shape = json.loads(sample['Rescale_origin_shape'])
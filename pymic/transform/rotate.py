@@ -75,8 +75,7 @@ class RandomRotate(AbstractTransform):
 
         transform_param_list is a list as saved in __call__().'''
         # get the paramters for invers transformation
-        if(isinstance(sample['RandomRotate_Param'], list) or \
-            isinstance(sample['RandomRotate_Param'], tuple)):
+        if(isinstance(sample['RandomRotate_Param'], (list, tuple))):
             transform_param_list = json.loads(sample['RandomRotate_Param'][0]) 
         else:
             transform_param_list = json.loads(sample['RandomRotate_Param']) 
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function
+
+import numpy as np
+from numba import njit
+
+@njit(cache = True)
+def _row_nonzero_range(rows):
+    """
+    for each row of a 2D array, get the first and last index of nonzero
+    elements. rows without nonzero element have first index equal to the
+    row length and last index -1.
+    """
+    row_num, row_len = rows.shape
+    row_min = np.full(row_num, row_len, np.int64)
+    row_max = np.full(row_num, -1, np.int64)
+    for r in range(row_num):
+        for j in range(row_len):
+            if(rows[r, j] != 0):
+                row_min[r] = j
+                break
+        if(row_min[r] < row_len):
+            for j in range(row_len - 1, -1, -1):
+                if(rows[r, j] != 0):
+                    row_max[r] = j
+                    break
+    return row_min, row_max
+
+def is_kernel_supported(volume):
+    """
+    check whether an ndarray can be passed to the numba kernels, i.e., it has
+    a native byte order and a bool, integer, float32 or float64 type.
+    other arrays (e.g., float16) should use the numpy implementation.
+    """
+    dtype = volume.dtype
+    return (dtype.isnative and (dtype == np.bool_ or dtype.kind in 'iu' or
+        dtype == np.float32 or dtype == np.float64))
+
+def bbox_from_row_range(input_shape, row_min, row_max):
+    """
+    get the bounding box of an ND array from the nonzero range of each of its
+    rows along the last axis, as given by _row_nonzero_range.
+    """
+    row_nonzero = row_min < input_shape[-1]
+    indxes = np.nonzero(row_nonzero.reshape(input_shape[:-1]))
+    idx_min = []
+    idx_max = []
+    for i in range(len(input_shape) - 1):
+        idx_min.append(int(indxes[i].min()))
+        idx_max.append(int(indxes[i].max()) + 1)
+    idx_min.append(int(row_min[row_nonzero].min()))
+    idx_max.append(int(row_max.max()) + 1)
+    return idx_min, idx_max
+
+def bbox_nd(volume):
+    """
+    get the bounding box of nonzero region in an ND array (ND >= 2).
+    the volume is scanned only once: each row along the last axis is
+    reduced to its nonzero range by a compiled kernel, and the bounding box
+    along the other axes is obtained from the (much smaller) row map.
+    """
+    input_shape = volume.shape
+    if(volume.dtype == np.bool_):
+        volume = volume.view(np.uint8)
+    rows = volume.reshape(-1, input_shape[-1])
+    row_min, row_max = _row_nonzero_range(rows)
+    return bbox_from_row_range(input_shape, row_min, row_max)
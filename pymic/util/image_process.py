@@ -4,6 +4,10 @@ from __future__ import absolute_import, print_function
 import numpy as np
 import SimpleITK as sitk
 from scipy import ndimage
+try:
+    from pymic.util.bbox_numba import bbox_nd, is_kernel_supported
+except ImportError:
+    bbox_nd = None
 
 def get_ND_bounding_box(volume, margin = None):
     """
@@ -13,12 +17,16 @@ def get_ND_bounding_box(volume, margin = None):
     if(margin is None):
         margin = [0] * len(input_shape)
     assert(len(input_shape) == len(margin))
-    indxes = np.nonzero(volume)
-    idx_min = []
-    idx_max = []
-    for i in range(len(input_shape)):
-        idx_min.append(int(indxes[i].min()))
-        idx_max.append(int(indxes[i].max()) + 1)
+    if(bbox_nd is not None and isinstance(volume, np.ndarray) and len(input_shape) >= 2 
+        and is_kernel_supported(volume)):
+        idx_min, idx_max = bbox_nd(volume)
+    else:
+        indxes = np.nonzero(volume)
+        idx_min = []
+        idx_max = []
+        for i in range(len(input_shape)):
+            idx_min.append(int(indxes[i].min()))
+            idx_max.append(int(indxes[i].max()) + 1)
 
     for i in range(len(input_shape)):
         idx_min[i] = max(idx_min[i] - margin[i], 0)
@@ -32,26 +40,15 @@ def crop_ND_volume_with_bounding_box(volume, min_idx, max_idx):
     dim = len(volume.shape)
     assert(dim >= 2 and dim <= 5)
     assert(max_idx[0] - min_idx[0] <= volume.shape[0])
-    if(dim == 2):
-        output = volume[np.ix_(range(min_idx[0], max_idx[0]),
-                               range(min_idx[1], max_idx[1]))]
-    elif(dim == 3):
-        output = volume[np.ix_(range(min_idx[0], max_idx[0]),
-                               range(min_idx[1], max_idx[1]),
-                               range(min_idx[2], max_idx[2]))]
-    elif(dim == 4):
-        output = volume[np.ix_(range(min_idx[0], max_idx[0]),
-                               range(min_idx[1], max_idx[1]),
-                               range(min_idx[2], max_idx[2]),
-                               range(min_idx[3], max_idx[3]))]
-    elif(dim == 5):
-        output = volume[np.ix_(range(min_idx[0], max_idx[0]),
-                               range(min_idx[1], max_idx[1]),
-                               range(min_idx[2], max_idx[2]),
-                               range(min_idx[3], max_idx[3]),
-                               range(min_idx[4], max_idx[4]))]
-    else:
-        raise ValueError("the dimension number shoud be 2 to 5")
+    # slicing does not check the bounds, so check them explicitly
+    for i in range(dim):
+        assert(0 <= min_idx[i] <= max_idx[i] <= volume.shape[i]), \
+            "region {0:}-{1:} is out of the volume shape {2:}".format(
+            list(min_idx), list(max_idx), volume.shape)
+    # basic slicing gives a view of the subregion, and copying it is a single
+    # strided copy in C, which is much faster than fancy indexing with np.ix_
+    roi = tuple(slice(min_idx[i], max_idx[i]) for i in range(dim))
+    output = volume[roi].copy()
     return output
 
 def set_ND_volume_roi_with_bounding_box_range(volume, bb_min, bb_max, sub_volume, addition = True):